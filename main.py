@@ -1,7 +1,8 @@
 import numpy as np
-import random
+import os
 import sys
 import getopt
+import tempfile
 from datetime import datetime
 from multiprocessing import Event as ProcessEvent
 from multiprocessing import Process
@@ -16,21 +17,25 @@ from sensors.probe import *
 
 if __name__ == '__main__':
     # Default settings
-    connection_type = 'socket'
+    connection_type = 'unix_socket'
     host = '127.0.0.1'
     port = 33330
+    unix_socket_path = os.path.join(tempfile.gettempdir(), f"sensorlog-{os.getpid()}.sock")
     num_sensors = 5
+    min_dt = 0.2 # Sampling periods of the simulated sensors are evenly spread
+    max_dt = 1.0 # between these two values
     csv_logfile = datetime.now().strftime("sensorlog-%Y-%m-%d-%H-%M-%S.csv")
     sqlite_dbfile = datetime.now().strftime("sensorlog-%Y-%m-%d-%H-%M-%S.db")
     log_to_screen = False
     log_to_plot = False
     system_sensor_data = False
+    sensor_threads = False
     
     try:
         opts, args = getopt.getopt(sys.argv[1:],"n:c:p:c:s:o:r",
                                    ["num_sensors=", "connection_type=", "plot", 
                                     "csv_file", "screen_output", "system_data",
-                                    "port="])
+                                    "port=", "threads", "min_dt=", "max_dt="])
     except getopt.GetoptError:
         print("Error in parsing arguments")
         sys.exit(2)
@@ -52,6 +57,13 @@ if __name__ == '__main__':
             system_sensor_data = True
         elif opt in ("--port"):
             port = int(arg)
+        elif opt == "--min_dt":
+            min_dt = float(arg)
+        elif opt == "--max_dt":
+            max_dt = float(arg)
+        elif opt == "--threads":
+            # Run the sensors as threads in this process, instead of one process each
+            sensor_threads = True
 
 
             
@@ -63,6 +75,8 @@ if __name__ == '__main__':
     
     if connection_type == 'socket':
         connection_factory = partial(Connection.create_socket_connection, host=host, port=port)
+    elif connection_type == 'unix_socket':
+        connection_factory = partial(Connection.create_unix_socket_connection, path=unix_socket_path)
     elif connection_type == 'shared_memory':
         connection_factory = Connection.create_memory_connection
     elif connection_type == 'pipe':
@@ -81,7 +95,7 @@ if __name__ == '__main__':
         sensor_connections.append(client_connection)
         
         if server_connections != []:
-            if connection_type == 'socket':
+            if connection_type in ('socket', 'unix_socket'):
                 # Singleton server connection used with socket communication
                 # Avoid starting new thread to serve the same ip adress
                 pass
@@ -107,19 +121,23 @@ if __name__ == '__main__':
                          'Memory available (Gb)' : memory_available,
                          'CPU temperature (Celcius)' : cpu_temp}
     else:
-        dts = np.arange(1, num_sensors+2)/num_sensors # The sampling period of the sensors
+        dts = np.linspace(min_dt, max_dt, num_sensors).tolist() # The sampling period of the sensors
         sensor_probes = {}
         for dt_ in range(num_sensors):
-            sensor_probes[f'Sensor-{dt_}'] = lambda : random.randint(-100, 100)
+            sensor_probes[f'Sensor-{dt_}'] = RandomProbe(-100, 100)
             
     sensors = [Sensor(id, name, sampling_period = dt,
                       probe=sensor_probes[name],
                       connection = conn) \
                for id, name, dt, conn in zip(range(len(dts)), sensor_probes.keys(),
                                              dts, sensor_connections)]
-    print("Created sensor processes.")
-    sensor_processes = [Process(target=s.run, args=[proc_stop_event]) for s in sensors]
-    for p in sensor_processes:
+    if sensor_threads:
+        sensor_workers = [Thread(target=s.run, args=[thread_stop_event]) for s in sensors]
+        print("Created sensor threads.")
+    else:
+        sensor_workers = [Process(target=s.run, args=[proc_stop_event]) for s in sensors]
+        print("Created sensor processes.")
+    for p in sensor_workers:
         p.start()
     print("Started sensors.")
 
@@ -128,10 +146,10 @@ if __name__ == '__main__':
     thread_stop_event.set()
     proc_stop_event.set()
     
-    for p in sensor_processes:
+    for p in sensor_workers:
         p.join()
 
-    print("All sensor processes done.")
+    print("All sensors done.")
 
     for sc in server_connections:
         sc.close()
@@ -141,6 +159,8 @@ if __name__ == '__main__':
 
     print("All server threads done.")
 
+    logger.close() # Lets the repositories finish writing
+
 
     print("\n\n-----------------------------------------------------------\n")
     print("Logged data\n")
@@ -5,8 +5,47 @@ from utils.network import ClientConnection
 from service.model.message import Message
 
 class Sensor:
+    """ Samples the probe every sampling_period seconds and sends the samples over the
+    connection, batch_size frames at a time. When stopped, the samples collected so far are
+    sent, then a message with data None, and the connection is closed.
+
+    Tests
+    -----
+    >>> import io, contextlib
+    >>> class FakeConnection:
+    ...     def __init__(self):
+    ...         self.sent = []
+    ...         self.closed = False
+    ...     def is_available(self):
+    ...         return True
+    ...     def send_frames(self, frames):
+    ...         self.sent.append([m.data for m in Message.from_frames(frames)])
+    ...         return True
+    ...     def send(self, message):
+    ...         return self.send_frames(message.pack())
+    ...     def close(self):
+    ...         self.closed = True
+    >>> stop = Event()
+    >>> samples = iter(range(1, 8))
+    >>> def probe():
+    ...     value = next(samples)
+    ...     if value == 7:
+    ...         stop.set()
+    ...     return value
+    >>> conn = FakeConnection()
+    >>> sensor = Sensor(1, 'Sensor', 0.001, probe, conn, batch_size=3)
+    >>> with contextlib.redirect_stdout(io.StringIO()):
+    ...     sensor.run(stop)
+    >>> conn.sent, conn.closed
+    ([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0], [7.0], [None]], True)
+    >>> Sensor(1, 'Sensor', 0.001, probe, conn, batch_size=0)
+    Traceback (most recent call last):
+    ...
+    ValueError: batch_size must be at least 1
+    """
+
     def __init__(self, id : int, name : str, sampling_period : float,
-                 probe : Callable, connection : ClientConnection):
+                 probe : Callable, connection : ClientConnection, batch_size : int = None):
 
         self.id = id
         self.name = name
@@ -15,21 +54,46 @@ class Sensor:
         self.connection = connection
         
         self.message = Message(id, name, 0)
+
+        # Fast sensors collect samples in a buffer of binary frames which is sent in
+        # one go, at most every 50 ms. Slower sensors send every sample immediately.
+        if batch_size is None:
+            batch_size = max(1, int(0.05/sampling_period))
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.batch_size = batch_size
+        self._buf = bytearray(batch_size*Message.FRAME.size)
+        self._nframes = 0
         
     def run(self, stop_event : Event):
+        # Samples are taken at fixed times, so the time spent acquiring and sending does
+        # not add up to a drift. Waiting on the event lets the sensor stop right away.
+        deadline = time.monotonic()
         while True:
-            time.sleep(self.dt)
-            if stop_event.is_set():
+            deadline += self.dt
+            if stop_event.wait(max(0, deadline - time.monotonic())):
                 print(f"{self.name} received stop event. Sending None and closing connection.")
+                self.flush()
                 self.message.data = None
                 self.connection.send(self.message)
                 self.connection.close()
                 break
             self.acquire()
             if not self.connection.is_available():
+                # The server has stopped reading. Still release the connection's resources
+                print(f"{self.name} lost its connection. Closing it.")
+                self.connection.close()
                 break
-            self.connection.send(self.message)
+            self.message.pack_into(self._buf, self._nframes*Message.FRAME.size)
+            self._nframes += 1
+            if self._nframes == self.batch_size:
+                self.flush()
 
+    def flush(self):
+        """ Sends the samples collected in the buffer. """
+        if self._nframes:
+            self.connection.send_frames(memoryview(self._buf)[:self._nframes*Message.FRAME.size])
+            self._nframes = 0
 
     def acquire(self):
         self.data = self.probe()
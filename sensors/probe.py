@@ -1,20 +1,111 @@
+import os
+import time
+import threading
+import numpy as np
 import psutil
 
+class Sampler:
+    """ Reads the system data with psutil in a background thread, every period seconds.
+    The probe functions below return the latest values, so a sensor does not wait for
+    psutil to read /proc when sampling. 
+
+    There is one instance per process, created by the first call to Sampler.inst().
+
+    Tests
+    -----
+    >>> sampler = Sampler.inst()
+    >>> Sampler.inst() is sampler
+    True
+
+    A sampler inherited from a parent process, i.e. with another pid, is replaced
+    >>> import os
+    >>> sampler.pid = -1
+    >>> Sampler.inst() is sampler, Sampler.inst().pid == os.getpid()
+    (False, True)
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, period : float = 1.0):
+        self.period = period
+        self.pid = os.getpid()
+        self.sample()
+        # The first call to cpu_percent(interval=None) has nothing to compare with
+        self.cpu = psutil.cpu_percent(interval=0.1)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def inst():
+        with Sampler._lock:
+            # A sampler inherited from a parent process has no thread running
+            if Sampler._instance is None or Sampler._instance.pid != os.getpid():
+                Sampler._instance = Sampler()
+            return Sampler._instance
+
+    def run(self):
+        while True:
+            time.sleep(self.period)
+            self.sample()
+
+    def sample(self):
+        self.cpu = psutil.cpu_percent(interval=None) # Since the previous call
+        self.load, _, _ = psutil.getloadavg()
+        self.memory = psutil.virtual_memory().available*1e-9 # Convert to Gb
+        self.temperature = _read_cpu_temp()
+
 def cpu_utilization():
-    return psutil.cpu_percent()
+    return Sampler.inst().cpu
 
 def load_average():
-    la,_,_ = psutil.getloadavg()
-    return la
+    return Sampler.inst().load
 
 def memory_available():
-    mem = psutil.virtual_memory()
-    return mem.available*1e-9 # Convert to Gb
+    return Sampler.inst().memory
 
 def cpu_temp():
+    return Sampler.inst().temperature
+
+def _read_cpu_temp():
     temps = psutil.sensors_temperatures()
     if temps == {}:
         return -1
     key, val = next(iter( temps.items() )) # Just guessing that the first is the interesting one.
     return val[0].current
-    
+
+
+class RandomProbe:
+    """ Probe returning random integers between low and high (inclusive), like
+    random.randint(low, high). The numbers are drawn by numpy in blocks of block_size
+    values, so the cost of calling the random number generator is paid once per block.
+
+    The generator is created on the first call, i.e. in the process running the sensor,
+    so that sensors in forked processes do not share the same sequence.
+
+    Tests
+    -----
+    Values are in [low, high], also after refilling the block
+    >>> probe = RandomProbe(-2, 2, block_size=3)
+    >>> values = [probe() for i in range(10)]
+    >>> all(-2 <= v <= 2 for v in values)
+    True
+    >>> probe = RandomProbe(0, 1, block_size=3)
+    >>> sorted(set(probe() for i in range(200)))
+    [0, 1]
+    """
+
+    def __init__(self, low : int = -100, high : int = 100, block_size : int = 1024):
+        self.low = low
+        self.high = high
+        self.block_size = block_size
+        self.rng = None
+        self.values = iter(())
+
+    def __call__(self):
+        try:
+            return next(self.values)
+        except StopIteration:
+            if self.rng is None:
+                self.rng = np.random.default_rng()
+            block = self.rng.integers(self.low, self.high, self.block_size, endpoint=True)
+            self.values = iter(block.tolist())
+            return next(self.values)
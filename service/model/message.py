@@ -1,6 +1,8 @@
 from typing import Any
-from datetime import datetime
+import calendar
 import json
+import struct
+import time
 import numpy as np
 
 class Message:
@@ -13,16 +15,29 @@ class Message:
        The ID of the sensor that generated the data
     name : str
        The name of the sensor that generated the data
-    time_stamp : datetime
-    data : Any
+    time_stamp : int
+       Time of data acquisition in nanoseconds since the epoch. Use
+       format_time_stamp() to get a human readable string.
+    data : float or None
+       The sample. Only numbers and None survive the binary frame, where the data is a double.
 
     
     Methods
     -------
+    to_tuple() -> tuple
+       Returns the attributes as a tuple, in the order of __slots__.
+    to_dict() -> dict
+       Returns the attributes as a dict, keyed by name.
     to_json() -> str
        Returns a json string with the all the data.
     from_json(j : str)
        Replaces data fields with data in json string.
+    pack() -> bytes
+       Returns the message as a fixed-size binary frame of FRAME.size bytes.
+    pack_into(buf, offset : int)
+       Writes the binary frame into a writable buffer at offset.
+    unpack(buf)
+       Replaces data fields with data in the binary frame.
 
     Static methods
     --------------
@@ -30,6 +45,10 @@ class Message:
        Returns a message object with arbitrary attributes.
     from_json_str() -> Message
        Returns a message object constructed from the json string. 
+    from_bytes() -> Message
+       Returns a message object constructed from a binary frame.
+    from_frames() -> iterator
+       Returns an iterator over message objects in a buffer of consecutive frames.
 
     Tests
     -----
@@ -40,9 +59,36 @@ class Message:
     >>> msg2.data += 2
     >>> msg1 == msg2
     False
+    >>> msg3 = Message.from_bytes(msg1.pack())
+    >>> msg1 == msg3
+    True
+    >>> len(msg1.pack()) == Message.FRAME.size
+    True
+    >>> import pickle
+    >>> pickle.loads(pickle.dumps(msg1)) == msg1
+    True
+    >>> buf = bytearray(2*Message.FRAME.size)
+    >>> msg1.pack_into(buf, 0)
+    >>> msg2.pack_into(buf, Message.FRAME.size)
+    >>> list(Message.from_frames(buf)) == [msg1, msg2]
+    True
+    >>> Message.from_bytes(Message(1, 'Load average (divide with number of cpu cores)', 1.0).pack()).name
+    'Load average (divide with number of cpu cores)'
+    >>> long_name = Message.from_bytes(Message(1, 'a' + 'é'*40, None).pack()).name
+    >>> long_name == 'a' + 'é'*31, len(long_name.encode()) <= Message.NAME_SIZE
+    (True, True)
      
     """
 
+    # Messages are created for every sample, so there is no per-instance __dict__.
+    __slots__ = ('id', 'name', 'data', 'time_stamp')
+
+    # Binary frame used for inter-process communication: id, has_data flag, data,
+    # time stamp and name. The name is utf8, null-padded to fixed length. Longer names are
+    # cut, on a character boundary.
+    NAME_SIZE = 64 # Bytes
+    FRAME = struct.Struct(f'<i?dq{NAME_SIZE}s')
+
         
     def __init__(self, id : int, name : str, data : Any, time_stamp = None):
         self.id = id
@@ -52,23 +98,47 @@ class Message:
     def set_data(self, data : Any, time_stamp = None):
         self.data = data
         if time_stamp is None:
-            # Take current time
-            self.time_stamp = datetime.now().strftime("%Y-%m-%d_%H:%M:%S.%f")
+            # Take current time. Formatting is left to whoever presents the data.
+            self.time_stamp = time.time_ns()
         else:
             self.time_stamp = time_stamp
         
+    def to_tuple(self) -> tuple:
+        return (self.id, self.name, self.data, self.time_stamp)
+
+    def to_dict(self) -> dict:
+        return dict(zip(Message.__slots__, self.to_tuple()))
+
     def to_json(self) -> str:
-        return json.dumps(self.__dict__)
+        return json.dumps(self.to_dict())
 
     def from_json(self, j : str):
         jdict = json.loads(j)
-        attrs = self.__dict__.keys()
+        attrs = Message.__slots__
         for key, val in jdict.items(): 
             if key in attrs:
                 setattr(self, key, val)
 
         return self
 
+    def pack(self) -> bytes:
+        has_data = self.data is not None
+        return Message.FRAME.pack(self.id, has_data, self.data if has_data else 0.0,
+                                  self.time_stamp, _encode_name(self.name))
+
+    def pack_into(self, buf, offset : int):
+        has_data = self.data is not None
+        Message.FRAME.pack_into(buf, offset, self.id, has_data, self.data if has_data else 0.0,
+                                self.time_stamp, _encode_name(self.name))
+
+    def unpack(self, buf, offset : int = 0):
+        id, has_data, data, time_stamp, name = Message.FRAME.unpack_from(buf, offset)
+        self.id = id
+        self.data = data if has_data else None
+        self.time_stamp = time_stamp
+        self.name = name.rstrip(b'\0').decode(errors='replace')
+        return self
+
     def from_list(self, l : list):
         self.id = int(l[0])
         self.name = str(l[1])
@@ -77,13 +147,24 @@ class Message:
         except ValueError:
             # Set to np.nan if not possible to parse.
             self.data = np.nan
-        self.time_stamp = str(l[3])
+        if isinstance(l[3], str):
+            self.time_stamp = parse_time_stamp(l[3])
+        else:
+            self.time_stamp = int(l[3])
         return self
     
     def from_json_str(j : str):
         m = Message(42, 'unknown', 1) # Just temporary
         return m.from_json(j)
 
+    def from_bytes(buf, offset : int = 0):
+        m = Message(42, 'unknown', 1) # Just temporary
+        return m.unpack(buf, offset)
+
+    def from_frames(buf):
+        return (Message.from_bytes(buf, offset)
+                for offset in range(0, len(buf), Message.FRAME.size))
+
     def message():
         return Message(-1, "Unknown", 1)
 
@@ -91,15 +172,47 @@ class Message:
         return Message(-1, "Unknown", 1).from_list(l)
     
     def __eq__(self, other):
-        return (self.__dict__ == other.__dict__)
+        return (self.to_tuple() == other.to_tuple())
     def __ne__(self, other):
-        return (self.__dict__ != other.__dict__)
+        return (self.to_tuple() != other.to_tuple())
     
 
     def __str__(self) -> str:
-        return f'id = {self.id},  name = {self.name}, data = {self.data}, timestamp = {self.time_stamp}'
+        return f'id = {self.id},  name = {self.name}, data = {self.data}, timestamp = {format_time_stamp(self.time_stamp)}'
 
     
+    def __reduce__(self):
+        """ Pickles as a call to the constructor with the four attributes. """
+        return (Message, self.to_tuple())
+
     def copy(self):
         """ Deep copy of the object. """
         return Message(self.id, self.name, self.data, self.time_stamp)
+
+
+def _encode_name(name : str) -> bytes:
+    """ Returns the name as utf8, cut to Message.NAME_SIZE bytes without splitting a character. """
+    encoded = name.encode()
+    if len(encoded) > Message.NAME_SIZE:
+        encoded = encoded[:Message.NAME_SIZE].decode(errors='ignore').encode()
+    return encoded
+
+def format_time_stamp(time_stamp : int) -> str:
+    """ Returns the time stamp (nanoseconds since the epoch) as an ISO 8601 string in UTC,
+    keeping the full nanosecond resolution.
+
+    Tests
+    -----
+    >>> format_time_stamp(1700000000123456789)
+    '2023-11-14T22:13:20.123456789Z'
+    >>> parse_time_stamp(format_time_stamp(1700000000123456789))
+    1700000000123456789
+    """
+    seconds, nanoseconds = divmod(time_stamp, 1_000_000_000)
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)) + f'.{nanoseconds:09d}Z'
+
+def parse_time_stamp(s : str) -> int:
+    """ Inverse of format_time_stamp(). Returns nanoseconds since the epoch. """
+    date_time, _, fraction = s.rstrip('Z').partition('.')
+    seconds = calendar.timegm(time.strptime(date_time, '%Y-%m-%dT%H:%M:%S'))
+    return seconds*1_000_000_000 + int(fraction.ljust(9, '0'))
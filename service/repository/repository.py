@@ -1,16 +1,21 @@
+import io
+import os
 import sys
 import numpy as np
 from abc import ABCMeta, abstractmethod
 import csv
-from datetime import datetime
 import multiprocessing as mp
+from multiprocessing.connection import Connection
 import threading as mt
 import queue as qmod
 from itertools import chain
+from operator import attrgetter
 import matplotlib.pyplot as plt
 import sqlite3
+import time
+import traceback
 from typing import Any
-from service.model.message import Message
+from service.model.message import Message, format_time_stamp
 
 
 class Repository():
@@ -31,6 +36,19 @@ class Repository():
     def append(self, message: Message):
         self.message_list.append(message)
 
+    def extend(self, messages : list):
+        """Appends all the messages, as one operation. The server side calls this with all
+        messages decoded from one read."""
+        self.message_list.extend(messages)
+
+    def flush(self):
+        """Blocks until all messages appended so far are handled. Nothing to wait for here."""
+        pass
+
+    def close(self):
+        """Releases resources. To be called when no more messages will be appended."""
+        pass
+
     def __iter__(self):
         return iter(self.message_list)
 
@@ -41,46 +59,187 @@ class Repository():
         
     # Factory methods generating decorations.  These decorates the object with new behavior
     def screen_dump(self, where=sys.stdout):
-        return ScreenRepository(where, self)
+        return ScreenRepository(self, where)
 
     def csv(self, filename : str):
         return CSVRepository(filename, self)
 
-    def sql(self, filename : str):
-        return SQLRepository(filename, self)
+    def sql(self, filename : str, batch_size : int = 10000):
+        return SQLRepository(filename, self, batch_size)
 
     def plot(self,num_sensors : int):
         return PlotRepository(num_sensors, self)
 
 class RepositoryDecorator(Repository, metaclass=ABCMeta):
     """For common functionality of the different concrete decorator classes, including
-    synchronization with a lock, and calling the decorated object's append() method.
-
-    Subclasses must implement the _handle(message : Message) method.
+    calling the decorated object's append() method and handing the message over to a
+    dedicated writer thread.
+
+    append() is called from several server threads. It only puts the message on a queue
+    and returns, so the server threads do not wait for file or database I/O, nor for each
+    other. The writer thread is the only one calling _handle(), so no lock is needed.
+    extend() puts the whole list on the queue as one item, so a batch from a sensor costs one
+    queue operation. The queue holds at most queue_size items. If the writer thread falls
+    that far behind, append() and extend() block until there is room, rather than letting
+    memory grow.
+
+    Subclasses must implement the _handle(message : Message) method, or _handle_batch(messages)
+    to deal with all messages taken from the queue in one go. Subclasses that buffer
+    their output override _flush(), which the writer thread calls at least every
+    flush_period seconds and when flush() is called, and _close() to release resources.
+
+    If _handle_batch(), _flush() or _close() raises, the exception is printed to stderr and
+    kept in error. The writer thread goes on taking items from the queue, so nothing blocks,
+    but discards them. append() and extend() then only pass messages on to the decorated
+    repository, and flush() raises RuntimeError.
     """
 
+    flush_period = 1.0 # Seconds
+    queue_size = 65536 # Messages or lists of messages
+    drain_size = 256 # Items taken from the queue per wake-up
+
     def __init__(self, repository : Repository):
         self.repo = repository
-        self.lock = mt.Lock()
+        self.queue = qmod.Queue(maxsize=self.queue_size)
+        # Bound once, since append() is called for every message by every server thread
+        self._repo_append = repository.append
+        self._repo_extend = repository.extend
+        self._queue_put = self.queue.put
+        self.error = None # Set if the writer thread fails
+        self.writer = mt.Thread(target=self._write, daemon=True)
+        self.writer.start()
 
     def append(self, message : Message):
-        self.repo.append(message) # First let the decorated object do its work
-        with self.lock:           # Then the decoration
+        self._repo_append(message) # First let the decorated object do its work
+        if self.error is None:
+            self._queue_put(message) # Then the decoration, in the writer thread
+
+    def extend(self, messages : list):
+        self._repo_extend(messages)
+        if self.error is None:
+            self._queue_put(messages)
+
+    def flush(self):
+        self.repo.flush()
+        if self.writer.is_alive():
+            done = mt.Event()
+            self.queue.put(done) # Handled after everything already in the queue
+            done.wait()
+        if self.error is not None:
+            raise RuntimeError(f"{type(self).__name__} has stopped writing") from self.error
+
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        self.repo.close()
+
+    def __iter__(self):
+        """Iterates over the decorated repository, for decorators that do not store messages."""
+        return iter(self.repo)
+
+    def _write(self):
+        """Run by the writer thread until close() is called. After a blocking get, whatever
+        else is waiting in the queue is taken as well, up to drain_size items, so the queue's
+        lock is taken once per item but the thread only wakes up once per batch."""
+        flushed_at = time.monotonic()
+        closing = False
+        while not closing:
+            try:
+                items = [self.queue.get(timeout=self.flush_period)]
+            except qmod.Empty:
+                items = [mt.Event()] # Idle, so good time to flush
+            try:
+                while len(items) < self.drain_size:
+                    items.append(self.queue.get_nowait())
+            except qmod.Empty:
+                pass
+            messages = []
+            markers = []
+            for item in items:
+                if isinstance(item, Message):
+                    messages.append(item)
+                elif isinstance(item, list):
+                    messages.extend(item) # From extend()
+                else:
+                    markers.append(item)
+            closing = any(marker is None for marker in markers)
+            if self.error is None:
+                try:
+                    if messages:
+                        self._handle_batch(messages)
+                    if markers or time.monotonic() - flushed_at > self.flush_period:
+                        self._flush()
+                        flushed_at = time.monotonic()
+                except Exception as error:
+                    self._fail(error)
+            for marker in markers:
+                if marker is not None:
+                    marker.set() # Flush marker
+        try:
+            self._close()
+        except Exception as error:
+            self._fail(error)
+
+    def _fail(self, error : Exception):
+        if self.error is None:
+            self.error = error
+        print(f"{type(self).__name__} failed, messages are no longer written:", file=sys.stderr)
+        traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+    def _handle_batch(self, messages : list):
+        for message in messages:
             self._handle(message)
 
     @abstractmethod
     def _handle(self, message : Message):
         pass
+
+    def _flush(self):
+        pass
+
+    def _close(self):
+        pass
     
 class ScreenRepository(RepositoryDecorator):
+    """ Prints the messages, one line per message. Lines are collected in a buffer which is
+    written with a single call at least every flush_period seconds, or when it grows large.
+    """
+
+    flush_period = 0.1 # Seconds. Short, since someone is watching
 
     def __init__(self, repository : Repository, where=sys.stdout):
-        super().__init__(repository)
         self.file = where
+        try:
+            self.fd = where.fileno() # Write directly to the file descriptor if there is one
+        except (AttributeError, io.UnsupportedOperation):
+            self.fd = None
+        self.buffer = bytearray()
+        super().__init__(repository)
 
 
     def _handle(self, message : Message):
-        print("\t".join(map(str, message.__dict__.values())), file=self.file)
+        self._handle_batch([message])
+
+    def _handle_batch(self, messages : list):
+        # One f-string per line and a single encode for the whole batch
+        self.buffer += "".join([f"{m.id}\t{m.name}\t{m.data}\t{format_time_stamp(m.time_stamp)}\n"
+                                for m in messages]).encode()
+        if len(self.buffer) > 4096:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        if self.fd is None:
+            self.file.write(self.buffer.decode())
+        else:
+            self.file.flush() # Keep the order of anything printed through the file object
+            with memoryview(self.buffer) as view:
+                written = 0
+                while written < len(view):
+                    written += os.write(self.fd, view[written:])
+        self.buffer.clear()
 
 
 class CSVRepository(RepositoryDecorator):
@@ -102,35 +261,93 @@ class CSVRepository(RepositoryDecorator):
     True
     True
     True
+
+    All rows are in the file after flush() and close()
+    >>> sent = [Message(i % 4, f'Sensor {i % 4}', float(i), i) for i in range(20000)]
+    >>> for start in range(0, len(sent), 100):
+    ...     rep.extend(sent[start:start + 100])
+    >>> rep.flush()
+    >>> sum(1 for m in rep) == len(sent) + 1
+    True
+    >>> rep.close()
+    >>> list(rep)[1:] == sent
+    True
+
+    Other number types, such as numpy's, are written as floats
+    >>> import numpy as np
+    >>> rep = Repository().csv('/tmp/csvtest-numpy.csv')
+    >>> rep.extend([Message(1, 'a', np.float64(1.5), 1), Message(1, 'a', np.int64(2), 2),
+    ...             Message(1, 'a', 3, 3)])
+    >>> [m.data for m in rep]
+    [1.5, 2.0, 3.0]
+    >>> rep.close()
     """
     
     def __init__(self, filename : str, repository : Repository):
-        super().__init__(repository)
         self.filename = filename
-        self.header_written = False
+        self.fd = None # Opened by the writer thread at the first message
+        self.buffer = bytearray() # Rows not yet written to the file
+        self.csv_names = {} # Sensor name -> csv field as bytes, quoted if needed
+        super().__init__(repository) # Last, since it starts the writer thread
         
+    buffer_size = 128*1024 # Bytes
+    header = ",".join(Message.__slots__).encode() + b"\r\n"
+    # Rows are formatted directly as bytes. The data is formatted as a float, as it is sent
+    # in a frame, and %a gives its repr(), like csv.writer
+    row_format = b"%d,%s,%a,%s\r\n"
+
     def _handle(self, message : Message):
-        if message.data is None:
-            return # Not saving None data, which is used as flag to stop logging.
-        with open(self.filename, 'a', newline='') as csvfile:
-            cw = csv.writer(csvfile)
-            if not self.header_written:
-                cw.writerow(list(message.__dict__.keys()))
-                self.header_written = True
-            cw.writerow(list(message.__dict__.values()))
+        self._handle_batch([message])
+
+    def _handle_batch(self, messages : list):
+        if self.fd is None:
+            # A plain file descriptor, since rows are collected in self.buffer and written
+            # in one go. No buffered-I/O layer in between
+            self.fd = os.open(self.filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            self.buffer += self.header
+        names = self.csv_names
+        row_format = self.row_format
+        rows = []
+        for message in messages:
+            if message.data is None:
+                continue # Not saving None data, which is used as flag to stop logging.
+            name = names.get(message.name)
+            if name is None:
+                name = names[message.name] = _csv_field(message.name)
+            rows.append(row_format % (message.id, name, float(message.data),
+                                      format_time_stamp(message.time_stamp).encode()))
+        self.buffer += b"".join(rows)
+        if len(self.buffer) >= self.buffer_size:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            with memoryview(self.buffer) as view:
+                written = 0
+                while written < len(view):
+                    written += os.write(self.fd, view[written:])
+            self.buffer.clear()
+
+    def _close(self):
+        if self.fd is not None:
+            os.close(self.fd)
 
     def __iter__(self):
-        """Returns a list containing the rows of the whole file."""
+        """Yields the messages in the file, one row at a time."""
+        self.flush()
         with open(self.filename, newline='') as csvfile:
             cr = csv.reader(csvfile)
             next(cr) # Skip the first line with headings
-            rows = [Message.message_from_list(row) for row in cr]
-            return iter(rows)
+            for row in cr:
+                yield Message.message_from_list(row)
         
 class SQLRepository(RepositoryDecorator):
     """
     Creates (if needed) and saves data to an SQLite database on file. 
 
+    Rows are collected and inserted batch_size at a time with executemany, in one
+    transaction. The writer thread also flushes at least every flush_period seconds, so a
+    large batch_size does not delay rows from slow sensors for long.
 
     Tests
     ----
@@ -149,15 +366,43 @@ class SQLRepository(RepositoryDecorator):
     True
     True
     True
+
+    All rows are in the database after flush() and close()
+    >>> sent = [Message(i % 4, f'Sensor {i % 4}', float(i), i) for i in range(25000)]
+    >>> for start in range(0, len(sent), 100):
+    ...     rep.extend(sent[start:start + 100])
+    >>> rep.flush()
+    >>> sum(1 for m in rep) == len(sent) + 1
+    True
+    >>> rep.close()
+    >>> list(rep)[1:] == sent
+    True
     """
 
-    def __init__(self,  filename : str, repository : Repository):
-        super().__init__(repository)
+    def __init__(self,  filename : str, repository : Repository, batch_size : int = 10000):
         self.filename = filename
         self.table = "sensor_messages"
         self.initial_db = 'message_id INTEGER PRIMARY KEY'
         self.table_created = False
         self.rowid = 0
+        self.batch_size = batch_size
+        self.rows = [] # To be inserted in the next transaction
+        self.fields = attrgetter(*Message.__slots__) # Column values of a message, as a tuple
+        self.insert_sql = None # Prepared when the table is created
+        # A single connection, used by the writer thread only. With the WAL journal and
+        # synchronous=NORMAL a commit does not wait for the disk. A power failure may lose
+        # the last transactions, but does not corrupt the database.
+        # Transactions are begun and committed explicitly, in _flush().
+        self.con = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        # Temporary tables and indices in memory, a 256 MiB page cache (negative size is in
+        # KiB), and reads through a memory map of up to 1 GiB of the file instead of read()
+        self.con.execute("PRAGMA temp_store=MEMORY")
+        self.con.execute("PRAGMA cache_size=-262144")
+        self.con.execute("PRAGMA mmap_size={}".format(1<<30))
+        self.cur = self.con.cursor()
+        super().__init__(repository)
 
     def _handle(self, message : Message):
         if message.data is None:
@@ -166,28 +411,47 @@ class SQLRepository(RepositoryDecorator):
             self._create_table(message)
             self.table_created = True
             
-        with sqlite3.connect(self.filename) as con:
-            cur = con.cursor()
-            cur.execute('INSERT INTO {} VALUES (?, ?, ?, ?, ?)'.format(self.table),
-                        [self.rowid] + list(message.__dict__.values()))
-            cur.close()
-            self.rowid += 1
-
+        self.rows.append((self.rowid, *self.fields(message)))
+        self.rowid += 1
+        if len(self.rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        """ Inserts the collected rows in a single transaction. """
+        if self.rows:
+            # IMMEDIATE takes the write lock up front, instead of upgrading a read lock
+            self.cur.execute("BEGIN IMMEDIATE")
+            try:
+                self.cur.executemany(self.insert_sql, self.rows)
+            except sqlite3.Error:
+                self.cur.execute("ROLLBACK")
+                raise
+            self.cur.execute("COMMIT")
+            self.rows.clear()
+
+    def _close(self):
+        self.cur.close()
+        self.con.close()
                 
     def _create_table(self, message):
-        with sqlite3.connect(self.filename) as con:
-            cur = con.cursor()
-            cur.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(self.table, self.initial_db))
-            try:
-                for k, v in message.__dict__.items():
-                    sql = "ALTER TABLE {} ADD {} {}".format(self.table, k,
-                                                            SQLRepository.to_sql_string(v))
+        cur = self.con.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(self.table, self.initial_db))
+        try:
+            for k, v in message.to_dict().items():
+                sql = "ALTER TABLE {} ADD {} {}".format(self.table, k,
+                                                        SQLRepository.to_sql_string(v))
                     
-                    cur.execute(sql)
-            except sqlite3.OperationalError:
-                # Already defined the columns, so ignore error
-                pass
-            cur.close()
+                cur.execute(sql)
+        except sqlite3.OperationalError:
+            # Already defined the columns, so ignore error
+            pass
+        cur.close()
+        # The rowid and one value per message field, with the columns named, so the statement
+        # does not depend on the column order in an existing table. Built once, so sqlite3
+        # finds the statement in its cache for every batch
+        columns = ('message_id',) + Message.__slots__
+        self.insert_sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            self.table, ', '.join(columns), ', '.join('?'*len(columns)))
 
     def to_sql_string(v : Any) -> str:
         """Returns the sql type as a string corresponding to the datatype of the argument.
@@ -200,24 +464,19 @@ class SQLRepository(RepositoryDecorator):
         raise NotImplemented("Only types str, int and float supported")
 
     def __iter__(self):
-        self.rowid = 0
-        return self
-
-    def __next__(self):
-        with sqlite3.connect(self.filename) as con:
-            message = Message.message()
-            cur = con.cursor()
-            res = cur.execute('SELECT * FROM {} WHERE rowid = {}'.format(self.table, self.rowid))
-            row = res.fetchall()
-            if len(row) == 0:
-                cur.close()
-                raise StopIteration
-            else:
-                self.rowid += 1
-                message.from_list(row[0][1:]) # The first element is the unique rowid no used in the message
-
-                cur.close()
-                return message
+        """Yields the messages in the database in the order they were inserted, from a single
+        query on a connection of its own. Does not disturb the row ids of the inserts."""
+        self.flush()
+        con = sqlite3.connect(self.filename)
+        try:
+            cur = con.execute('SELECT {} FROM {} ORDER BY message_id'.format(
+                ', '.join(Message.__slots__), self.table))
+            for row in cur:
+                message = Message.message()
+                message.from_list(row)
+                yield message
+        finally:
+            con.close()
     
 class PlotRepository(RepositoryDecorator):
     """
@@ -225,29 +484,72 @@ class PlotRepository(RepositoryDecorator):
 
     Due to a restriction that Matplotlib figures in TKinter can only run in the main
     loop, a separate process is spawn for the plot.
+
+    The samples are handed over in shared memory. Each sensor has a ring of ring_size
+    time stamps and values, and a count of samples written so far. The writer thread is
+    the only one writing, and bumps the count after the sample is in place, so the plot
+    process can read everything up to the count without a lock. The first message from
+    each sensor is also sent over a pipe, so the plot process gets the name of the sensor.
     """
 
+    ring_size = 8192 # Samples per sensor
+
     def __init__(self, num_sensors : int, repository : Repository, figsize=(14,10)):
-        super().__init__(repository)
         self.stop_event = mp.Event()
-        self.message_queue = mp.Queue()
+        raw_times = mp.RawArray('q', num_sensors*self.ring_size)
+        raw_values = mp.RawArray('d', num_sensors*self.ring_size)
+        raw_heads = mp.RawArray('Q', num_sensors)
+        self.times = np.frombuffer(raw_times, dtype=np.int64).reshape(num_sensors, -1)
+        self.values = np.frombuffer(raw_values, dtype=np.float64).reshape(num_sensors, -1)
+        self.heads = np.frombuffer(raw_heads, dtype=np.uint64)
+        self.started = set() # Sensors whose first message is sent to the plot process
+        # A one-way pipe: no feeder thread and no lock, since there is one sender and one receiver
+        receiver, self.sender = mp.Pipe(duplex=False)
         self.plot_proc = mp.Process(target=PlotRepositoryBackend.run,
-                                 args=[self.stop_event, self.message_queue, num_sensors, figsize])
+                                 args=[self.stop_event, receiver, raw_times, raw_values,
+                                       raw_heads, num_sensors, figsize])
         self.plot_proc.start()
+        receiver.close() # Only the plot process reads
+        super().__init__(repository) # Last, since it starts the writer thread
         
     def _handle(self, message : Message):
-        if message.data is None:
-            # This is a flag raied by the sensor process that it is closing down.
-            self.stop_event.set()
+        self._handle_batch([message])
+
+    def _handle_batch(self, messages : list):
+        if self.stop_event.is_set():
             return
-        self.message_queue.put(message.to_json())
+        for message in messages:
+            if message.data is None:
+                # This is a flag raied by the sensor process that it is closing down.
+                self.stop_event.set()
+                return
+            if message.id not in self.started:
+                self.started.add(message.id)
+                try:
+                    self.sender.send_bytes(message.pack())
+                except OSError:
+                    # The plot process has closed down
+                    self.stop_event.set()
+                    return
+            head = int(self.heads[message.id])
+            slot = head % self.ring_size
+            self.times[message.id, slot] = message.time_stamp
+            self.values[message.id, slot] = message.data
+            self.heads[message.id] = head + 1 # Last, so the plot process sees a complete sample
+
+    def _close(self):
+        self.sender.close()
 
 class PlotRepositoryBackend:
     """
     Creates a figure and plots data as they arrive.
     """
 
-    def run(stop_event : mp.Event, queue : mp.Queue,  num_sensors : int, figsize=(14,10)):
+    frame_rate = 30 # Redraws per second, at most
+    history = 4096 # Samples shown per sensor
+
+    def run(stop_event : mp.Event, receiver : Connection, raw_times, raw_values, raw_heads,
+            num_sensors : int, figsize=(14,10)):
 
         nrows = int(num_sensors/2) + num_sensors % 2
         ncols = 2
@@ -259,80 +561,129 @@ class PlotRepositoryBackend:
         plt.show()
         # So that in the case of a single axes, it also  becomes a list: 
         axs = list(chain.from_iterable(axs)) 
+        times = np.frombuffer(raw_times, dtype=np.int64).reshape(num_sensors, -1)
+        values = np.frombuffer(raw_values, dtype=np.float64).reshape(num_sensors, -1)
+        heads = np.frombuffer(raw_heads, dtype=np.uint64)
+        ring_size = times.shape[1]
+        read = [0]*num_sensors # Samples read from each ring so far
         start_times = [None]*num_sensors 
-        lines = {}
-        ymax = {}
-        ymin = {}
+        # State per sensor, indexed by sensor id
+        lines = [None]*num_sensors
+        history = PlotRepositoryBackend.history
+        xs = [None]*num_sensors # Sample times and values, room for twice the history. When
+        ys = [None]*num_sensors # full, the last samples are moved to the front
+        counts = [0]*num_sensors
+        ymax = [float('-inf')]*num_sensors
+        ymin = [float('inf')]*num_sensors
+        # Blitting: the axes, with everything but the lines, are drawn only when a title or
+        # limit changes. Otherwise the saved backgrounds are restored and the lines drawn on top
+        blit = fig.canvas.supports_blit
+        backgrounds = [None]*num_sensors
+        def save_backgrounds(event):
+            for sid, ax in enumerate(axs[:num_sensors]):
+                backgrounds[sid] = fig.canvas.copy_from_bbox(ax.bbox)
+            for line in lines:
+                if line is not None:
+                    line.axes.draw_artist(line)
+        fig.canvas.mpl_connect('draw_event', save_backgrounds)
+        last_draw = time.monotonic()
+        changed = set() # Sensors with new samples since the last redraw
+        full_redraw = False
         while True:
             if stop_event.is_set():
                 break
 
-            try:
-                j_str = queue.get(timeout=0.01)
-            except qmod.Empty:
-                continue
-            
-
-            message = Message.from_json_str(j_str)
-            
-            ax = axs[message.id]
-            if start_times[message.id] is None: # First message received from that sensor
-                start_times[message.id] = datetime.fromisoformat(message.time_stamp)
-                line, = ax.plot(0, message.data, 'bo')
+            # First messages received from sensors
+            first_messages = []
+            while receiver.poll(0 if first_messages else 1/PlotRepositoryBackend.frame_rate):
+                try:
+                    first_messages.extend(Message.from_frames(receiver.recv_bytes()))
+                except EOFError:
+                    stop_event.set()
+                    break
+            for message in first_messages:
+                ax = axs[message.id]
+                start_times[message.id] = message.time_stamp
+                line, = ax.plot([], [], 'bo', animated=blit)
                 ax.set_title(message.name)
                 ax.set_xlabel("Time [s]")
                 lines[message.id] = line
-                ymax[message.id] = _max(message.data)
-                ymin[message.id] = ymax[message.id]
-                
-                
-            start_t = start_times[message.id]
-            t = (datetime.fromisoformat(message.time_stamp) - start_t).total_seconds()
-            line = lines[message.id]
-            line.set_xdata(np.append(line.get_xdata(), t))
-            line.set_ydata(np.append(line.get_ydata(), message.data))
-
-            # Adjust axes limits
-            maxdata = _max(message.data)
-            if maxdata > ymax[message.id]:
-                ymax[message.id] = maxdata
-                top_lim = 1.05*maxdata # Give some margin
-            else:
-                top_lim = None # Keep original limit
-                
-            mindata = _min(message.data)
-            if mindata < ymin[message.id]:
-                ymin[message.id] = mindata
-                if mindata < 0:
-                    bottom_lim = 1.05*mindata # Give some margin
+                xs[message.id] = np.empty(2*history)
+                ys[message.id] = np.empty(2*history)
+                full_redraw = True
+
+            for sid, start_t in enumerate(start_times):
+                head = int(heads[sid])
+                if start_t is None or head == read[sid]:
+                    continue
+                # The new samples, or the last ring_size of them if the plot has fallen behind
+                slots = np.arange(max(read[sid], head - ring_size), head) % ring_size
+                read[sid] = head
+                new_t = (times[sid, slots] - start_t)*1e-9
+                new_y = values[sid, slots]
+                if len(slots) > history:
+                    new_t, new_y = new_t[-history:], new_y[-history:]
+                k = len(new_t)
+                x, y, n = xs[sid], ys[sid], counts[sid]
+                if n + k > 2*history:
+                    keep = history - k
+                    x[:keep] = x[n-keep:n]
+                    y[:keep] = y[n-keep:n]
+                    n = keep
+                x[n:n+k] = new_t
+                y[n:n+k] = new_y
+                n += k
+                counts[sid] = n
+                first = max(0, n - history)
+                lines[sid].set_data(x[first:n], y[first:n])
+
+                # Adjust axes limits, only when the new samples fall outside them
+                ymax[sid] = max(ymax[sid], float(new_y.max()))
+                ymin[sid] = min(ymin[sid], float(new_y.min()))
+                ax = axs[sid]
+                bottom_lim, top_lim = ax.get_ylim()
+                if ymax[sid] > top_lim or ymin[sid] < bottom_lim:
+                    if ymax[sid] > top_lim:
+                        top_lim = 1.05*ymax[sid] # Give some margin
+                    if ymin[sid] < bottom_lim:
+                        if ymin[sid] < 0:
+                            bottom_lim = 1.05*ymin[sid] # Give some margin
+                        else:
+                            bottom_lim = ymin[sid] - 0.05*ymax[sid]  # Give some margin
+                    ax.set_ylim(bottom = bottom_lim, top=top_lim)
+                    full_redraw = True
+                right = ax.get_xlim()[1]
+                if x[n-1] > right:
+                    # Move the time axis in steps of a quarter of the window, rather than at
+                    # every sample, so the background can be reused in between
+                    span = max(2, x[n-1] - x[first])
+                    ax.set_xlim(left=x[first], right=x[n-1] + span/4)
+                    full_redraw = True
+                changed.add(sid)
+
+            # Redraw at most frame_rate times per second, covering all samples since the last one
+            now = time.monotonic()
+            if (changed or full_redraw) and now - last_draw >= 1/PlotRepositoryBackend.frame_rate:
+                if full_redraw or not blit:
+                    fig.canvas.draw() # Saves the backgrounds and draws the lines
+                    if blit:
+                        fig.canvas.blit(fig.bbox)
                 else:
-                    bottom_lim = mindata - 0.05*maxdata  # Give some margin
-            else:
-                bottom_lim = None # Keep original limit
-
-            ax.set_xlim(right=t+2)
-            ax.set_ylim(bottom = bottom_lim, top=top_lim)
-            fig.canvas.draw()
-            fig.canvas.flush_events()
+                    for sid in changed:
+                        ax = axs[sid]
+                        fig.canvas.restore_region(backgrounds[sid])
+                        ax.draw_artist(lines[sid])
+                        fig.canvas.blit(ax.bbox)
+                fig.canvas.flush_events()
+                last_draw = now
+                changed.clear()
+                full_redraw = False
         
         print("Plot is closing down")
         
         
-def _max(v):
-    """ Version of regular max() function that handles scalars as well. """
-    try:
-        vm = max(v)
-        return vm
-    except TypeError:
-        # Scalar data
-        return v
-
-def _min(v):
-    """ Version of regular min() function that handles scalars as well. """
-    try:
-        vm = min(v)
-        return vm
-    except TypeError:
-        # Scalar data
-        return v
-    
+def _csv_field(s : str) -> bytes:
+    """ Returns the string as a csv field, quoted the same way as csv.writer does. """
+    if any(c in s for c in ',"\r\n'):
+        s = '"' + s.replace('"', '""') + '"'
+    return s.encode()
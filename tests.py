@@ -1,14 +1,23 @@
 """ Runs doctests
 """
 import doctest
-from utils.network import SMServerConnection
-from service.model.message import Message
+from service.model.message import Message, format_time_stamp, parse_time_stamp
 from service.repository.repository import CSVRepository, SQLRepository, Repository
+from utils.network import (ServerConnection, UnixServer, UnixClientConnection,
+                           SMClientConnection, SMServerConnection, Event, socket)
+from sensors.base_sensor import Sensor
+from sensors.probe import RandomProbe, Sampler
 
 if __name__ == '__main__':
-    doctest.run_docstring_examples(SMServerConnection.chop_json, globals())
     doctest.run_docstring_examples(Message, globals())
+    doctest.run_docstring_examples(format_time_stamp, globals())
     doctest.run_docstring_examples(CSVRepository, globals())
     doctest.run_docstring_examples(SQLRepository, globals())
+    doctest.run_docstring_examples(ServerConnection, globals())
+    doctest.run_docstring_examples(UnixServer, globals())
+    doctest.run_docstring_examples(SMServerConnection, globals())
+    doctest.run_docstring_examples(Sensor, globals())
+    doctest.run_docstring_examples(RandomProbe, globals())
+    doctest.run_docstring_examples(Sampler, globals())
 
     
@@ -1,16 +1,29 @@
+import os
 import sys
-import time
 import socket
+import struct
+import selectors
 import multiprocessing
 from multiprocessing import shared_memory
 from multiprocessing import connection
-from threading import Thread, Event
+from threading import Event
 from service.model.message import Message
 from service.repository.repository import Repository
 
 #import time
 #from threading import Thread
 
+SOCKET_BUFFER_SIZE = 4 << 20 # Bytes
+_FRAME_SIZE = Message.FRAME.size
+
+def _tune_socket(sckt : socket.socket) -> None:
+    """ Sends small messages immediately (no Nagle delay) and enlarges the kernel buffers,
+    so bursts from the sensors are not throttled. """
+    if sckt.family in (socket.AF_INET, socket.AF_INET6):
+        sckt.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sckt.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sckt.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+
 class ServerSingletonMeta(type):
     """
     From https://refactoring.guru/design-patterns/singleton/python/example
@@ -46,14 +59,24 @@ class ClientConnection:
        Returns True if connection is established and data can be sent
     send(d : Message) -> bool
        Returns True if sending was successfully completed
+    send_frames(frames : bytes) -> bool
+       Sends one or more consecutive binary frames (see Message.pack_into).
+       Returns True if sending was successfully completed
        
     """
 
+    family = socket.AF_INET
+
     def __init__(self, host : str, port : int):
 
         self.host = host
         self.port = port
-        self.sckt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._setup()
+
+    def _setup(self) -> None:
+        """ Socket and state, shared by the subclasses, which only differ in the address. """
+        self.sckt = socket.socket(self.family, socket.SOCK_STREAM)
+        _tune_socket(self.sckt)
         self.available = True
         self.connected = False
             
@@ -61,25 +84,27 @@ class ClientConnection:
         return self.available
 
         
+    def _address(self):
+        return (self.host, self.port)
+        
     def __connect(self) -> None:
-        con = self.sckt.connect((self.host, self.port))
+        con = self.sckt.connect(self._address())
         self.connected = True
         print("Client connected")
 
     def send(self, d : Message) -> bool:
+        return self.send_frames(d.pack())
+
+    def send_frames(self, frames) -> bool:
         if not self.connected:
             self.__connect()
 
-        msg = d.to_json().encode()
-        msglen = len(msg)
-        totalsent = 0
-        while totalsent < msglen:
-            sent = self.sckt.send(msg[totalsent:])
-            if sent == 0:
-                self.available = False
-                return False
-            else:
-                totalsent = totalsent + sent
+        try:
+            self.sckt.sendall(frames)
+        except (BrokenPipeError, ConnectionResetError):
+            # The server has closed the connection
+            self.available = False
+            return False
         return True
 
     def close(self):
@@ -90,71 +115,86 @@ class ClientConnection:
 class ServerConnection():
     """ Representation of the server side connection for communication over sockets.
 
-    Singleton.
+    Does not run in a thread of its own. The Server calls read() whenever the socket has
+    data available.
 
     Attributes
     ----------
-    host : str
-       The ip_address of the server to connect to. Defaults to '127.0.0.1' 
-    port : int
-       The port to connect to. Defaults to 33333
-    scket : Socket
+    sckt : Socket
        The socket to communicate with
+    repository : Repository
+       Where received messages are appended
 
     Methods
     -------
-    run() -> None
-       Starts listening for connections
-       
+    read() -> bool
+       Reads available data, appends the complete messages to the repository. Returns
+       False when the client has closed the connection.
+
+    Tests
+    -----
+    Frames split across reads are kept until they are complete
+    >>> client, server = socket.socketpair()
+    >>> repo = Repository()
+    >>> conn = ServerConnection(server, repo)
+    >>> sent = [Message(1, 'Sensor', 1.0, 1), Message(1, 'Sensor', None, 2)]
+    >>> frames = sent[0].pack() + sent[1].pack()
+    >>> client.sendall(frames[:10]); conn.read(), len(repo.message_list)
+    (True, 0)
+    >>> client.sendall(frames[10:Message.FRAME.size + 5]); conn.read(), len(repo.message_list)
+    (True, 1)
+    >>> client.sendall(frames[Message.FRAME.size + 5:]); conn.read(), repo.message_list == sent
+    (True, True)
+    >>> client.close(); conn.read()
+    False
+    >>> server.close()
     """
 
+    buffer_size = 65536 # Bytes
+
     def __init__(self, sckt : socket.socket, repo : Repository):
         self.sckt = sckt
         self.repository = repo
+        # Received into, and decoded from, in place
+        self.buffer = bytearray(self.buffer_size)
+        self.view = memoryview(self.buffer)
+        self.pending = 0 # Bytes at the start of the buffer, of a frame not completely received
+        # Acknowledge at once instead of delaying the ACK (Linux only). The kernel may fall
+        # back to delayed ACKs, so it is set again after every read
+        self.quickack = (hasattr(socket, 'TCP_QUICKACK')
+                         and sckt.family in (socket.AF_INET, socket.AF_INET6))
+        if self.quickack:
+            self.sckt.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        # Looked up once, since read() runs for every chunk received
+        self._recv_into = sckt.recv_into
+        self._setsockopt = sckt.setsockopt
+        self._extend = repo.extend
         
-    def __call__(self, stop_event : Event):
-        """ Function run by thread. Receives data over the socket, parses and calls repository.
-        
-            Code adapted from https://docs.python.org/3/howto/sockets.html
-       """
-        while True:
-            if stop_event.is_set():
-                print(f"ServerConnection with socket {self.sckt} received stop signal")
-                break
-            self.repository.append(Message.from_json_str(self.__read()))
-            
-    def __read(self) -> str:
-        """ Will read data from the socket and checking for opening and closing curly
-            brackets. Returns when a string with balanced curly brackets is found.
-            """
-        opening_brackets = 0
-        closing_brackets = 0
-        
-        chunks = []
-        bytes_recd = 0
-        # Read to find first opening bracket 
-        while opening_brackets == 0:
-            chunk = self.sckt.recv(1024)
-            if chunk == b'':
-                raise RuntimeError("socket connection broken")
-            opening_brackets += chunk.count(b'{')
-            closing_brackets += chunk.count(b'}')
-            chunks.append(chunk)
-
-        # Continue reading until balanced number of brackets
-        while opening_brackets > closing_brackets:
-            chunk = self.sckt.recv(2048)
-            if chunk == b'':
-                raise RuntimeError("socket connection broken")
-            opening_brackets += chunk.count(b'{')
-            closing_brackets += chunk.count(b'}')
-            chunks.append(chunk)
-            
-        return b''.join(chunks)
+    def read(self) -> bool:
+        view = self.view
+        pending = self.pending
+        try:
+            n = self._recv_into(view[pending:])
+        except ConnectionResetError:
+            n = 0
+        if n == 0:
+            return False
+        if self.quickack:
+            self._setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+        end = pending + n
+        complete = end - end % _FRAME_SIZE
+        if complete:
+            self._extend(list(Message.from_frames(view[:complete])))
+        self.pending = end - complete
+        self.buffer[:self.pending] = view[complete:end] # Move the partial frame first
+        return True
         
 class Server(metaclass=ServerSingletonMeta):
     """ Representation of the server side for communication over sockets. Listens for 
-    connections, instantiates  ServerConnection objects and spawns threads to handle communication. 
+    connections and instantiates ServerConnection objects to handle communication. A single
+    thread serves all connections, using a selector to wait for any of the sockets to
+    become readable.
 
     Attributes
     ----------
@@ -168,157 +208,301 @@ class Server(metaclass=ServerSingletonMeta):
     Methods
     -------
     run() -> None
-       Starts listening for connections
+       Starts listening for connections. After the stop signal, data still arriving is read,
+       and run() returns once the clients have closed their connections or been quiet for
+       wait_period seconds.
        
     """
 
+    family = socket.AF_INET
+
     def __init__(self, host : str, port : int, repository : Repository):
         self.host = host
         self.port = port
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.settimeout(0.2)
+        self._setup(repository)
+
+    def _setup(self, repository : Repository) -> None:
+        """ State shared by the subclasses, which only differ in the address. """
+        self.server_socket = None # Created in run(), so only a running server holds a socket
         self.repository = repository
         self.client_sockets = []
+        self.running = False
+        self.closed = Event()
+        self.wait_period = 0.2 # Seconds between checks of the stop signal
 
         
+    def _address(self):
+        return (self.host, self.port)
+
+    def _create_socket(self) -> socket.socket:
+        sckt = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family != socket.AF_UNIX:
+            sckt.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Also on the listening socket, before listen(), since some platforms let accepted
+        # sockets inherit the options and the buffer sizes affect the negotiated TCP window
+        _tune_socket(sckt)
+        sckt.settimeout(0.2)
+        return sckt
+
     def run(self, stop_event : Event):
+        if self.running or self.closed.is_set():
+            return # Already served by another call, or closed before it started
         print(f"")
-        self.server_socket.bind((self.host, self.port))
+        self.running = True
+        self.server_socket = self._create_socket()
+        self.server_socket.bind(self._address())
         self.server_socket.listen()
-        print(f"Server {self.host}:{self.port} is listening.")
+        print(f"Server {self._address()} is listening.")
+        selector = selectors.DefaultSelector()
+        selector.register(self.server_socket, selectors.EVENT_READ)
         while True:
-            if stop_event.is_set():
-                print("Server received stop signal.")
-                self.server_socket.close()
+            events = selector.select(timeout=self.wait_period)
+            for key, _ in events:
+                if key.fileobj is self.server_socket:
+                    client_sock, addr = self.server_socket.accept()
+                    _tune_socket(client_sock)
+                    print("Server accepting connection")
+                    self.client_sockets.append(client_sock)
+                    selector.register(client_sock, selectors.EVENT_READ,
+                                      ServerConnection(client_sock, self.repository))
+                elif not key.data.read():
+                    # Client closed the connection
+                    selector.unregister(key.fileobj)
+                    self.client_sockets.remove(key.fileobj)
+                    key.fileobj.close()
+            # After the stop signal, what the clients still send is read, until they have
+            # closed their connections or been quiet for wait_period seconds
+            if (stop_event.is_set() or self.closed.is_set()) and not events:
                 break
-                #for cs in self.client_sockets:
-                #    cs.close()
-            try: 
-                client_sock, addr = self.server_socket.accept()
-                print("Server accepting connection")
-                self.client_sockets.append(client_sock)
-                conn = ServerConnection(client_sock, self.repository)
-                Thread(target=conn, args=[stop_event]).start()
-            except socket.timeout:
-                pass
-            
-    def close(self):
-        print(f"Server host = {self.host} and port = {self.port} is closing down.")
+
+        print("Server received stop signal.")
+        selector.close()
         self.server_socket.close()
         for cs in self.client_sockets:
             cs.close()
+            
+    def close(self):
+        """ The sockets are closed by the thread in run(), if it is running. """
+        print(f"Server {self._address()} is closing down.")
+        self.closed.set()
         
 
+class UnixClientConnection(ClientConnection):
+    """ Client side connection over a unix domain socket. Works like ClientConnection,
+    but only between processes on the same host, and without the overhead of the tcp/ip stack.
+
+    Attributes
+    ----------
+    path : str
+       The file system path of the socket the server listens on
+    """
+
+    family = socket.AF_UNIX
+
+    def __init__(self, path : str):
+        self.path = path
+        self._setup()
+
+    def _address(self):
+        return self.path
+
+class UnixServer(Server):
+    """ Server side for communication over a unix domain socket. Singleton, like Server.
+
+    Tests
+    -----
+    What is sent before the client closes is read, even if the stop signal comes first
+    >>> import io, contextlib, time
+    >>> from threading import Thread
+    >>> repo = Repository()
+    >>> server = UnixServer('/tmp/sensorlog-doctest.sock', repo)
+    >>> client = UnixClientConnection(server.path)
+    >>> sent = [Message(1, 'Sensor', float(i), i) for i in range(5000)] + [Message(1, 'Sensor', None, 5000)]
+    >>> frames = b"".join(m.pack() for m in sent)
+    >>> stop = Event()
+    >>> with contextlib.redirect_stdout(io.StringIO()):
+    ...     thread = Thread(target=server.run, args=[stop])
+    ...     thread.start()
+    ...     time.sleep(0.5) # Until the server listens
+    ...     ok = client.send_frames(frames)
+    ...     stop.set()
+    ...     client.close()
+    ...     thread.join()
+    ...     server.close()
+    >>> ok, repo.message_list == sent
+    (True, True)
+    """
+
+    family = socket.AF_UNIX
+
+    def __init__(self, path : str, repository : Repository):
+        self.path = path
+        self._setup(repository)
+
+    def _address(self):
+        return self.path
+
+    def _create_socket(self) -> socket.socket:
+        if os.path.exists(self.path):
+            os.unlink(self.path) # Left behind by an earlier run
+        return super()._create_socket()
+
+    def close(self):
+        super().close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# Each slot of the shared-memory ring starts with the number of frames it holds.
+_SLOT_HEADER = struct.Struct('<I')
+
 class SMClientConnection:
-    """ Represents the client side of the communication. Holds the shared memory and the condition 
-    variable to synchronize access.
+    """ Represents the client side of the communication. Holds the shared memory and the
+    semaphores to synchronize access.
+
+    The shared memory is a ring of slots, with one writer (the client) and one reader (the
+    server). The semaphore free_slots counts the slots the client may write, and filled_slots
+    the slots the server may read. The client acquires a free slot, writes it and releases a
+    filled one. The server does the opposite. Each side keeps its own position in the ring. An
+    acquire that does not have to wait costs no system call, and one that waits sleeps in the
+    kernel until the other side releases.
+
+    When the ring is full, send_frames() waits for the server for as long as it takes, like
+    sendall() on a socket. It only gives up, and the connection becomes unavailable, once
+    the server has stopped reading, which the server signals with the event server_done.
     """
 
+    slots = 64
+    slot_size = 2048 # Bytes, including the slot header
+
     def __init__(self):
-        #self.condition_var = multiprocessing.Condition() Not shared in child processes
-        self.new_data_flag = shared_memory.SharedMemory(create=True, size = 1)
-        self.new_data_flag.buf[0] = 0
-        self.message = shared_memory.SharedMemory(create=True, size=2048)
-        self.wait_period = 0.001 # Period to wait between checks of data read.
+        self.frames_per_slot = (self.slot_size - _SLOT_HEADER.size) // Message.FRAME.size
+        self.ring = shared_memory.SharedMemory(create=True, size=self.slots*self.slot_size)
+        self.free_slots = multiprocessing.Semaphore(self.slots)
+        self.filled_slots = multiprocessing.Semaphore(0)
+        self.server_done = multiprocessing.Event() # Set when the server stops reading
+        self.head = 0 # Slots written so far
+        self.wait_period = 0.2 # Seconds between checks of server_done, while the ring is full
+        self.available = True
         
     def send(self, d : Message) -> bool:
-        while self.new_data_flag.buf[0]:
-            # The previous message has not been read. Wait for short period
-            time.sleep(self.wait_period)
-            
-        msg = d.to_json().encode()
-        msglen = len(msg)
-        if msglen > len(self.message.buf):
-            raise MemoryError("Message too long for shared memory buffer")
-
-        self.message.buf[:msglen] = msg
-        self.new_data_flag.buf[0] = 1 # Will signal consumer 
+        return self.send_frames(d.pack())
+
+    def send_frames(self, frames) -> bool:
+        """ Batches larger than a slot take several slots. """
+        msg = memoryview(frames)
+        buf = self.ring.buf
+        chunklen = self.frames_per_slot * Message.FRAME.size
+        for start in range(0, len(msg), chunklen):
+            while not self.free_slots.acquire(timeout=self.wait_period):
+                if self.server_done.is_set():
+                    self.available = False
+                    return False
+
+            chunk = msg[start:start+chunklen]
+            offset = (self.head % self.slots)*self.slot_size
+            _SLOT_HEADER.pack_into(buf, offset, len(chunk) // Message.FRAME.size)
+            offset += _SLOT_HEADER.size
+            buf[offset:offset+len(chunk)] = chunk
+            self.head += 1
+            self.filled_slots.release() # Will signal consumer 
+        return True
 
     def is_available(self):
-        return True # Always there
+        return self.available
 
     def close(self):
         """ Called by Sensor object when receiving stop signal."""
         print("Closing and unlinking shared memory for ", self)
-        self.message.close()
-        self.message.unlink()
-        self.new_data_flag.close()
-        self.new_data_flag.unlink()
+        self.ring.close()
+        self.ring.unlink()
 
 class SMServerConnection:
     """ Code run in a separate thread which will block at client object waiting for update to the 
     shared memory (Message object). The message object is passed on to the repository.
+
+    After the stop signal, frames still arriving from the client are read, and run() returns
+    once the client has been quiet for wait_period seconds.
+
+    Tests
+    -----
+    Batches of different sizes, filling the ring several times over
+    >>> import io, contextlib
+    >>> from threading import Thread
+    >>> client = SMClientConnection()
+    >>> repo = Repository()
+    >>> server = SMServerConnection(repo, client)
+    >>> sent = [Message(i % 3, 'Sensor', float(i), i) for i in range(4*client.slots*client.frames_per_slot)]
+    >>> frames = b"".join(m.pack() for m in sent)
+    >>> sizes = [1, client.frames_per_slot, client.frames_per_slot + 1, 7]
+    >>> stop = Event()
+    >>> with contextlib.redirect_stdout(io.StringIO()):
+    ...     thread = Thread(target=server.run, args=[stop])
+    ...     thread.start()
+    ...     start = 0
+    ...     while start < len(sent):
+    ...         n = sizes[start % len(sizes)]
+    ...         ok = client.send_frames(frames[start*Message.FRAME.size:(start + n)*Message.FRAME.size])
+    ...         start += n
+    ...     stop.set()
+    ...     thread.join()
+    ...     client.close()
+    >>> ok, client.head > 2*client.slots, repo.message_list == sent
+    (True, True, True)
+
+    Once the server has stopped, a client with a full ring gives up instead of waiting
+    >>> client = SMClientConnection()
+    >>> server = SMServerConnection(Repository(), client)
+    >>> with contextlib.redirect_stdout(io.StringIO()):
+    ...     server.close()
+    ...     ok = [client.send(Message(1, 'Sensor', 1.0)) for i in range(client.slots + 1)]
+    ...     client.close()
+    >>> ok.count(True) == client.slots, client.is_available()
+    (True, False)
     """
 
     def __init__(self, repository : Repository, client : SMClientConnection):
         self.repository = repository
-        self.message = shared_memory.SharedMemory(client.message.name)
-        self.new_data_flag = shared_memory.SharedMemory(client.new_data_flag.name)
-        self.new_data_flag.buf[0] = 0
-        self.wait_period = 0.001
+        self.ring = shared_memory.SharedMemory(client.ring.name)
+        self.slots = client.slots
+        self.slot_size = client.slot_size
+        self.free_slots = client.free_slots
+        self.filled_slots = client.filled_slots
+        self.done = client.server_done
+        self.tail = 0 # Slots read so far
+        self.wait_period = 0.2 # Seconds between checks of the stop signal
+        self.running = False
+        self.closed = Event()
+
     def run(self, stop_event : Event):
         print("ServerConnection ", self, " is running")
+        self.running = True
+        buf = self.ring.buf
         while True:
-            if stop_event.is_set():
-                print("ServerConnection ", self, " received stop signal")
-                self.message.close()
-                self.new_data_flag.close()
-                break
-
-            try: 
-                while not self.new_data_flag.buf[0]:
-                    time.sleep(self.wait_period)
-            except TypeError:
-                # TypeError is raised as a consequence  when self.new_data_flag is unlinked in other thread.
-                # Use this as a signal to exit
-                print("ServerConnection ", self, " closing down.")
-                self.message.close()
-                self.new_data_flag.close()
-                break
-
-                
-            m = SMServerConnection.chop_json(str(self.message.buf, 'utf8'))
-            self.repository.append(Message.from_json_str(m))
-            self.new_data_flag.buf[0] = 0
+            if not self.filled_slots.acquire(timeout=self.wait_period):
+                if stop_event.is_set() or self.closed.is_set():
+                    print("ServerConnection ", self, " received stop signal")
+                    break
+                continue
+
+            offset = (self.tail % self.slots)*self.slot_size
+            nframes = _SLOT_HEADER.unpack_from(buf, offset)[0]
+            offset += _SLOT_HEADER.size
+            self.repository.extend(
+                list(Message.from_frames(buf[offset:offset+nframes*Message.FRAME.size])))
+            self.tail += 1
+            self.free_slots.release() # The slot can be reused
+        self.done.set() # A client waiting for a free slot gives up
+        del buf
+        self.ring.close()
 
     def close(self):
+        """ The shared memory is closed by the thread in run(), if it is running. """
         print("ServerConnection ", self, " Closing down")
-        self.message.close()
-        self.new_data_flag.close()
-        
-    def chop_json(j : str) -> str:
-        """ Removes everything before and after a set of balanced curly brackets. 
-
-        Tests
-        -----
-        >>> j = '{"id": 0, "name": "Sensor-1", "data": -49, "time_stamp": "2023"}GARBAGE'
-        >>> jchopped = SMServerConnection.chop_json(j)
-        >>> jchopped == '{"id": 0, "name": "Sensor-1", "data": -49, "time_stamp": "2023"}'
-        True
-        >>> SMServerConnection.chop_json(jchopped) == jchopped
-        True
-        >>> j2 = jchopped + '}garbage}'
-        >>> jchopped2 = SMServerConnection.chop_json(j2)
-        >>> jchopped2 == jchopped
-        True
-       """
-
-        opening_brackets = 0
-        closing_brackets = 0
-        start_ind = -1
-        end_ind = -1
-        for ind, ch in zip(range(len(j)), j):
-            if ch == '{':
-                if start_ind < 0:
-                    start_ind = ind
-                opening_brackets += 1
-            if ch == '}':
-                closing_brackets += 1
-                if opening_brackets == closing_brackets:
-                    end_ind = ind
-                    break
-        return j[start_ind:end_ind+1]
+        self.closed.set()
+        if not self.running:
+            self.done.set()
+            self.ring.close()
 
 
 class PipeClientConnection:
@@ -327,12 +511,23 @@ class PipeClientConnection:
 
     def __init__(self, client_conn : connection.Connection ):
         self.pipe = client_conn
+        self.available = True
         
     def send(self, d : Message) -> bool:
-        self.pipe.send(d.to_json())
+        return self.send_frames(d.pack())
+
+    def send_frames(self, frames) -> bool:
+        """ Raw bytes, not pickled. """
+        try:
+            self.pipe.send_bytes(frames)
+        except (BrokenPipeError, ConnectionResetError):
+            # The server has closed its end
+            self.available = False
+            return False
         return True
+
     def is_available(self):
-        return True # Always there
+        return self.available
 
     def close(self):
         print("Closing down pipe.")
@@ -341,32 +536,42 @@ class PipeClientConnection:
 class PipeServerConnection:
     """ Code run in a separate thread which will block at client object waiting for update to the 
     shared memory (Message object). The message object is passed on to the repository.
+
+    Frames are sent with send_bytes and received with recv_bytes, so nothing is pickled. After
+    the stop signal, frames still arriving are read, and run() returns once the pipe has been
+    quiet for wait_period seconds, or the client has closed it.
     """
 
     def __init__(self, repository : Repository, server_conn : connection.Connection ):
         self.repository = repository
         self.pipe = server_conn
+        self.wait_period = 0.2 # Seconds between checks of the stop signal
+        self.running = False
+        self.closed = Event()
         
     def run(self, stop_event : Event):
         print("ServerConnection ", self, " is running")
+        self.running = True
         while True:
-            if stop_event.is_set():
-                print("ServerConnection ", self, " is closing down")
-                self.pipe.close()
-                break
-                
             try:
-                j_str = self.pipe.recv()
+                if not self.pipe.poll(self.wait_period):
+                    if stop_event.is_set() or self.closed.is_set():
+                        break
+                    continue
+                frames = self.pipe.recv_bytes()
             except EOFError:
-                print("ServerConnection ", self, " is closing down")
-                self.pipe.close()
                 break
             
-            self.repository.append(Message.from_json_str(j_str))
+            self.repository.extend(list(Message.from_frames(frames)))
+        print("ServerConnection ", self, " is closing down")
+        self.pipe.close()
 
     def close(self):
+        """ The pipe is closed by the thread in run(), if it is running. """
         print("Server pipe closing down.")
-        self.pipe.close()
+        self.closed.set()
+        if not self.running:
+            self.pipe.close()
         
 class Connection:
     """ Factory class for instantiating connection objects that handle the communication between sensors and repository.
@@ -377,6 +582,7 @@ class Connection:
     -------------------
     create_server( host : str, port : int, repository : Repository ) -> Server
     create_client_connection( host : str, port : int) -> ClientConnection
+    create_unix_socket_connection( repository : Repository, path : str) -> (UnixServer, UnixClientConnection)
     create_memory_connection( repository : Repository) -> (SMServerConnection, SMClientConnection)
     create_pipe_connection( repository : Repository) -> (PipeServerConnection, PipeClientConnection)
     """
@@ -385,6 +591,10 @@ class Connection:
     def create_socket_connection(repository, host='127.0.0.1', port=33331):
         return ( Server(host, port, repository), ClientConnection(host, port) )
 
+    def create_unix_socket_connection(repository : Repository,
+                                      path='/tmp/sensorlog.sock') -> (UnixServer, UnixClientConnection):
+        return ( UnixServer(path, repository), UnixClientConnection(path) )
+
     def create_memory_connection(repository : Repository) -> (SMServerConnection, SMClientConnection):
         client = SMClientConnection()
         server = SMServerConnection(repository, client) # The shared memory is attribute of the client 